@@ -1,14 +1,15 @@
 import streamlit as st
 import requests
+import json
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 from dotenv import load_dotenv
 import logging
 
+from requests.adapters import HTTPAdapter
 from sqlalchemy import create_engine, text
-from prophet import Prophet
-import plotly.graph_objects as go
 import pandas as pd
 
 logging.getLogger('cmdstanpy').setLevel(logging.ERROR)
@@ -24,6 +25,33 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 API_BASE_URL = os.getenv("API_URL", "http://127.0.0.1:8000")
 ANALYSIS_ENDPOINT = f"{API_BASE_URL}/run_analysis"
 
+@st.cache_resource # Share one connection pool across all sessions and reruns
+def get_engine():
+    """
+    Returns the dashboard's shared SQLAlchemy engine.
+    """
+    return create_engine(
+        DATABASE_URL,
+        pool_size=10,
+        max_overflow=20,
+        pool_timeout=30,
+        pool_recycle=1800,
+        pool_pre_ping=True,
+        pool_use_lifo=True,
+    )
+
+@st.cache_resource # One worker pool for background analysis requests across sessions
+def get_analysis_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=4)
+
+@st.cache_resource # Reuse keep-alive connections to the API server
+def get_http_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=10)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
 def render_title_and_description() -> None:
     st.title("🤖 Intelligent Supply Chain Resilience System")
     st.markdown("This dashboard runs a multi-agent analysis to identify at-risk suppliers and find related global news.")
@@ -35,6 +63,7 @@ def init_session_state():
         'analysis_running': False,
         'analysis_done': False,
         'alerts': [],
+        'analysis_future': None,
         'api_key': None,
         'project_id': None,
         'manual_analysis_selected': False,
@@ -54,7 +83,7 @@ def render_mode_toggle() -> None:
     else:
         st.session_state.manual_analysis_selected = False
 
-@st.cache_data(ttl=600) # Cache the data for 10 minutes
+@st.cache_resource(ttl=600) # Cache the data for 10 minutes; shared read-only, not copied per hit
 def fetch_latest_alerts():
 
 
@@ -62,17 +91,29 @@ def fetch_latest_alerts():
         st.error("DATABASE_URL is not set. Please configure your environment variables.")
         return pd.DataFrame()
     try:
-        engine = create_engine(DATABASE_URL)
+        engine = get_engine()
         with engine.connect() as conn:
-            df = pd.read_sql(
-                text("""
+            # Precomputed alerts JOIN suppliers, refreshed by the scheduled analysis.
+            # Until the server has created the view, join the tables directly.
+            if conn.execute(text("SELECT to_regclass('mv_latest_alerts')")).scalar() is not None:
+                alerts_query = text("""
+                    SELECT * FROM mv_latest_alerts
+                    ORDER BY timestamp DESC
+                    LIMIT 10;
+                """)
+            else:
+                alerts_query = text("""
                     SELECT a.*, s.latitude, s.longitude, s.risk_score, s.supplier_name
                     FROM alerts a
                     JOIN suppliers s ON a.supplier_id = s.supplier_id
                     ORDER BY a.timestamp DESC
                     LIMIT 10;
-                """),
-                conn
+                """)
+            df = pd.read_sql(
+                alerts_query,
+                conn,
+                # Arrow-backed columns hand straight to Streamlit's Arrow serialization
+                dtype_backend='pyarrow',
             )
             # Ensure timestamp is datetime
             df['timestamp'] = pd.to_datetime(df['timestamp'])
@@ -81,31 +122,66 @@ def fetch_latest_alerts():
         st.error(f"Could not fetch alerts: {e}")
         return pd.DataFrame()
 
-@st.cache_data(ttl=3600) # Cache forecast for 1 hour
-def generate_forecast_data(product_id: str):
+# Outlives the forecast cache, so an expired forecast is rebuilt without refitting
+# when the sales history hasn't changed
+@st.cache_resource(ttl=86400, max_entries=64)
+def fit_forecast_model(product_id: str, history_hash: int, _history: pd.DataFrame):
+    """
+    Fits Prophet on a product's sales history.
+    The model is reused while history_hash, a content hash of the history, is unchanged,
+    so new, corrected or backfilled rows all trigger a refit. The underscore keeps
+    Streamlit from hashing the DataFrame itself.
+    """
+    # Imported here so the Stan toolchain only loads once a forecast is requested
+    from prophet import Prophet
+
+    model = Prophet(weekly_seasonality=True, daily_seasonality=False)
+    model.fit(_history)
+    return model
+
+@st.cache_resource(ttl=3600) # Cache forecast for 1 hour; shared read-only, not copied per hit
+def generate_forecast_data(product_id: str, history_years: int = 2):
     """
-    Fetches sales data and runs Prophet to generate a forecast.
+    Fetches the last `history_years` of sales data and runs Prophet to generate a forecast.
     """
     if DATABASE_URL is None: return None
     try:
-        engine = create_engine(DATABASE_URL)
+        engine = get_engine()
         with engine.connect() as conn:
-            sales_query = text("SELECT ds, y FROM sales_history WHERE product_id = :pid ORDER BY ds;")
-            history = pd.read_sql(sales_query, conn, params={'pid': product_id}, parse_dates=['ds'])
+            # The window ends at the product's latest sale, not today, so older datasets still forecast
+            sales_query = text("""
+                SELECT ds, y FROM sales_history
+                WHERE product_id = :pid
+                  AND ds >= (SELECT max(ds) FROM sales_history WHERE product_id = :pid) - make_interval(years => :years)
+                ORDER BY ds;
+            """)
+            history = pd.read_sql(sales_query, conn, params={'pid': product_id, 'years': history_years}, parse_dates=['ds'])
         
         if len(history) < 10: return None
 
-        model = Prophet(weekly_seasonality=True, daily_seasonality=False)
-        model.fit(history)
+        history_hash = int(pd.util.hash_pandas_object(history, index=False).sum())
+        model = fit_forecast_model(product_id, history_hash, history)
         future = model.make_future_dataframe(periods=12, freq='W') # Forecast 12 weeks
         forecast = model.predict(future)
-        merged_df = pd.merge(forecast, history, on='ds', how='left')
-        return merged_df
+        # Only 'y' is added, so align it on ds rather than running a full merge.
+        # Duplicate dates are summed first, since reindex needs unique labels.
+        forecast['y'] = history.groupby('ds')['y'].sum().reindex(forecast['ds']).to_numpy()
+        return forecast
     except Exception as e:
         st.error(f"Could not generate forecast: {e}")
         return None
 
 
+@st.cache_data(ttl=3600) # The product list rarely changes
+def fetch_product_options() -> dict:
+    """
+    Returns a {product_name: product_id} mapping for the forecast dropdown.
+    """
+    engine = get_engine()
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT product_name, product_id FROM products ORDER BY product_name")).all()
+    return dict(rows)
+
 def render_automatic_mode() -> None:
     st.subheader("Displaying Latest Results from 24/7 Monitoring")
     alerts_df = fetch_latest_alerts()
@@ -113,16 +189,17 @@ def render_automatic_mode() -> None:
         st.map(alerts_df, latitude='latitude', longitude='longitude', size='risk_score')
 
         st.subheader("📢 Latest Monitored Risks:")
-        for _, row in alerts_df.iterrows():
-            priority = row['priority']
-            ts_str   = row['timestamp'].strftime('%Y-%m-%d %H:%M:%S UTC')
-            with st.expander(f"**{priority} ALERT** for **{row['supplier_name']}** (Monitored on: {ts_str})"):
+        alert_rows = alerts_df[['priority', 'timestamp', 'supplier_name', 'alert_text', 'id']]
+        for row in alert_rows.itertuples(index=False):
+            priority = row.priority
+            ts_str   = row.timestamp.strftime('%Y-%m-%d %H:%M:%S UTC')
+            with st.expander(f"**{priority} ALERT** for **{row.supplier_name}** (Monitored on: {ts_str})"):
                 st.text_area(
                     "Alert",
-                    value=row['alert_text'],
+                    value=row.alert_text,
                     height=300,
                     disabled=True,
-                    key=f"db_alert_{row['id']}",
+                    key=f"db_alert_{row.id}",
                     label_visibility="collapsed",
                 )
     else:
@@ -161,29 +238,46 @@ def render_manual_sidebar() -> None:
         st.markdown("2. [Follow this guide to create an API key](https://cloud.ibm.com/docs/account?topic=account-userapikey&interface=ui)")
         st.markdown("3. [Find your Project ID in watsonx.ai](https://dataplatform.cloud.ibm.com/wx/home)")
 
+def submit_analysis() -> None:
+    """
+    Sends the analysis request from a worker thread so the script run isn't blocked.
+    """
+    st.session_state.analysis_future = get_analysis_executor().submit(
+        get_http_session().get,
+        ANALYSIS_ENDPOINT,
+        params={
+            'api_key': st.session_state.api_key,
+            'project_id': st.session_state.project_id,
+        },
+        timeout=120,
+    )
+
+@st.fragment(run_every=2) # Poll the background request without rerunning the whole page
+def poll_analysis_result() -> None:
+    future = st.session_state.analysis_future
+    if not future.done():
+        st.info("⏳ Agents are analyzing... Please wait.")
+        return
+
+    try:
+        response = future.result()
+        response.raise_for_status()
+        results = response.json()
+        st.session_state.alerts = results.get("alerts", [])
+        st.success('Analysis Complete!')
+        time.sleep(1)
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error: Could not connect to the API server. Details: {e}")
+        st.session_state.alerts = []
+    st.session_state.analysis_future = None
+    st.session_state.analysis_running = False
+    st.session_state.analysis_done = True
+    st.rerun()
+
 def handle_analysis_execution() -> None:
     st.subheader("🔄 Trigger a New, On-Demand Analysis")
-    if st.session_state.analysis_running:
-        with st.spinner('Agents are analyzing... Please wait.'):
-            try:
-                response = requests.get(
-                    ANALYSIS_ENDPOINT,
-                    params={
-                        'api_key': st.session_state.api_key,
-                        'project_id': st.session_state.project_id,
-                    },
-                )
-                response.raise_for_status()
-                results = response.json()
-                st.session_state.alerts = results.get("alerts", [])
-                st.success('Analysis Complete!')
-                time.sleep(1)
-            except requests.exceptions.RequestException as e:
-                st.error(f"Error: Could not connect to the API server. Details: {e}")
-                st.session_state.alerts = []
-        st.session_state.analysis_running = False
-        st.session_state.analysis_done = True
-        st.rerun()
+    if st.session_state.analysis_running and st.session_state.analysis_future is not None:
+        poll_analysis_result()
 
 def render_manual_controls_and_results(credentials_ready: bool) -> None:
     run_btn = st.button(
@@ -194,6 +288,7 @@ def render_manual_controls_and_results(credentials_ready: bool) -> None:
         st.info("Click the button above to start the analysis.")
 
     if run_btn:
+        submit_analysis()
         st.session_state.analysis_running = True
         st.rerun()
 
@@ -213,48 +308,62 @@ def render_manual_mode() -> None:
     )
     render_manual_controls_and_results(credentials_ready)
 
+@st.cache_data(ttl=3600) # Rebuild the figure only when the forecast itself changes
+def build_forecast_figure(product_name: str, product_id, forecast_last_ds, history_years: int = 2) -> dict:
+    """
+    Builds the forecast chart for a product and returns it as a plain Plotly figure dict,
+    so reruns hand it to Streamlit without rebuilding a go.Figure.
+    forecast_last_ds is only part of the cache key.
+    """
+    import plotly.graph_objects as go
+
+    forecast_df = generate_forecast_data(product_id, history_years)
+    # Create a Plotly figure
+    fig = go.Figure()
+    # Add confidence interval shading
+    fig.add_trace(go.Scatter(
+        x=forecast_df['ds'], y=forecast_df['yhat_upper'], fill=None, mode='lines', 
+        line=dict(color='rgba(0,176,246,0.2)'), name='Confidence Upper Bound'
+    ))
+    fig.add_trace(go.Scatter(
+        x=forecast_df['ds'], y=forecast_df['yhat_lower'], fill='tonexty', mode='lines', 
+        line=dict(color='rgba(0,176,246,0.2)'), name='Confidence Lower Bound'
+    ))
+    # Add historical data points
+    fig.add_trace(go.Scatter(x=forecast_df['ds'], y=forecast_df['y'], mode='markers', name='Historical Sales', marker=dict(color='white')))
+    # Add the main forecast line
+    fig.add_trace(go.Scatter(x=forecast_df['ds'], y=forecast_df['yhat'], mode='lines', name='Forecast', line=dict(color='#00b0f0', width=3)))
+
+    fig.update_layout(
+        title=f'Sales Forecast for {product_name}',
+        xaxis_title='Date', yaxis_title='Weekly Units Sold',
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+    # Round-trip through JSON so the cached dict holds only plain, picklable values
+    return json.loads(fig.to_json())
+
 def render_forecast_chart() -> None:
     # --- Interactive Forecast Chart (Always Visible) ---
     st.markdown("---")
     st.subheader("📈 Interactive Demand Forecast")
-    engine = create_engine(DATABASE_URL)
-    with engine.connect() as conn:
-        query = text("SELECT product_id, product_name FROM products")
-        products = pd.read_sql(query, conn)
-        product_options = {row['product_name']: row['product_id'] for _, row in products.iterrows()}
+    product_options = fetch_product_options()
 
     product_names = ["Select a Product"] + list(product_options.keys())
     selected_product_name = st.selectbox("Select a Product to Forecast:", options=product_names)
     if selected_product_name == "Select a Product":
         selected_product_name = None
+    # Longer windows give more context but cost a fresh query and model fit
+    history_years = st.radio("Sales History Window (years):", (2, 5), horizontal=True)
 
     if selected_product_name:
         with st.spinner(f"Generating forecast for {selected_product_name}..."):
-            forecast_df = generate_forecast_data(product_options[selected_product_name])
+            forecast_df = generate_forecast_data(product_options[selected_product_name], history_years)
 
         if forecast_df is not None:
-            # Create a Plotly figure
-            fig = go.Figure()
-            # Add confidence interval shading
-            fig.add_trace(go.Scatter(
-                x=forecast_df['ds'], y=forecast_df['yhat_upper'], fill=None, mode='lines', 
-                line=dict(color='rgba(0,176,246,0.2)'), name='Confidence Upper Bound'
-            ))
-            fig.add_trace(go.Scatter(
-                x=forecast_df['ds'], y=forecast_df['yhat_lower'], fill='tonexty', mode='lines', 
-                line=dict(color='rgba(0,176,246,0.2)'), name='Confidence Lower Bound'
-            ))
-            # Add historical data points
-            fig.add_trace(go.Scatter(x=forecast_df['ds'], y=forecast_df['y'], mode='markers', name='Historical Sales', marker=dict(color='white')))
-            # Add the main forecast line
-            fig.add_trace(go.Scatter(x=forecast_df['ds'], y=forecast_df['yhat'], mode='lines', name='Forecast', line=dict(color='#00b0f0', width=3)))
-
-            fig.update_layout(
-                title=f'Sales Forecast for {selected_product_name}',
-                xaxis_title='Date', yaxis_title='Weekly Units Sold',
-                legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+            fig_dict = build_forecast_figure(
+                selected_product_name, product_options[selected_product_name], forecast_df['ds'].max(), history_years
             )
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(fig_dict, use_container_width=True)
         else:
             st.warning(f"Could not generate forecast for {selected_product_name}.")
 
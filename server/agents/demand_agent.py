@@ -1,54 +1,172 @@
 # demand_agent.py
 
+import os
+import numpy as np
 import pandas as pd
 from prophet import Prophet
+from prophet.serialize import model_to_json, model_from_json
 import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from sqlalchemy import text
 from ..utils.db import get_db_engine
 
 # Suppress verbose logging from Prophet
 logging.getLogger('cmdstanpy').setLevel(logging.ERROR)
 
-def get_demand_forecast(at_risk_supplier_id: int) -> str:
+# --- Configuration ---
+FORECAST_HORIZON_WEEKS = 4
+# The closed-form forecast is only trusted on long, steady histories; otherwise Prophet is used
+FAST_FORECAST_MIN_ROWS = 200
+FAST_FORECAST_MAX_NOISE = 0.25  # Residual std around the trend, relative to mean sales
+
+# Fitted models per product, tagged with the history they were trained on
+_fitted_models = {}
+_fitted_models_lock = threading.Lock()
+
+# Worker processes for Prophet fits, created on first use and kept across runs.
+# forkserver avoids forking this multi-threaded server while another thread holds a lock;
+# it isn't available on Windows, where spawn is used instead.
+FIT_POOL_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+_fit_pool = None
+_fit_pool_lock = threading.Lock()
+
+def _get_fit_pool() -> ProcessPoolExecutor:
+    global _fit_pool
+    with _fit_pool_lock:
+        if _fit_pool is None:
+            _fit_pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context(FIT_POOL_START_METHOD),
+            )
+        return _fit_pool
+
+def _reset_fit_pool() -> None:
     """
-    Finds products linked to a supplier and forecasts future demand using Prophet.
+    Discards a broken pool (e.g. a worker was OOM-killed) so the next run starts a fresh one.
     """
-    try:
-        engine = get_db_engine()
-        # Read both products and sales history from the database
-        products_query = text("SELECT * FROM products WHERE supplier_id = :supplier_id")
-        sales_query = text("SELECT * FROM sales_history")
-        
-        df_products = pd.read_sql(products_query, engine, params={'supplier_id': at_risk_supplier_id})
-        df_sales = pd.read_sql(sales_query, engine, parse_dates=['ds'])
+    global _fit_pool
+    with _fit_pool_lock:
+        if _fit_pool is not None:
+            _fit_pool.shutdown(wait=False, cancel_futures=True)
+            _fit_pool = None
 
-    except Exception as e:
-        return f"Database error: {e}"
+def _history_key(history: pd.DataFrame):
+    return (history['ds'].max(), len(history))
+
+def _get_cached_model(product_id, history: pd.DataFrame):
+    """
+    Returns the cached model for the product if it was fitted on this history, else None.
+    """
+    with _fitted_models_lock:
+        cached = _fitted_models.get(product_id)
+    if cached is not None and cached[0] == _history_key(history):
+        return cached[1]
+    return None
 
-    if df_products.empty:
+def _store_model(product_id, history: pd.DataFrame, model: Prophet) -> None:
+    with _fitted_models_lock:
+        _fitted_models[product_id] = (_history_key(history), model)
+
+def _fit_model(history: pd.DataFrame) -> Prophet:
+    # Prophet is designed to be robust and works well with default settings
+    model = Prophet(weekly_seasonality=True, daily_seasonality=False)
+    model.fit(history)
+    return model
+
+def _fit_model_json(history: pd.DataFrame) -> str:
+    """
+    Process-pool worker. Returns the fitted model in Prophet's JSON format,
+    which is the supported way to move a model between processes.
+    """
+    return model_to_json(_fit_model(history))
+
+def _get_fitted_model(product_id, history: pd.DataFrame) -> Prophet:
+    """
+    Returns a Prophet model for the product, refitting only when new sales rows arrive.
+    """
+    model = _get_cached_model(product_id, history)
+    if model is None:
+        model = _fit_model(history)
+        _store_model(product_id, history, model)
+    return model
+
+def _load_forecast_inputs(supplier_ids: list) -> dict:
+    """
+    Loads each supplier's forecast product and its sales history in one query.
+    Returns {supplier_id: rows}; suppliers without products are absent.
+    """
+    engine = get_db_engine()
+    # For simplicity, we'll forecast the first product (lowest product_id) for each supplier
+    forecast_query = text("""
+        WITH p AS (
+            SELECT DISTINCT ON (supplier_id) supplier_id, product_id, product_name
+            FROM products
+            WHERE supplier_id = ANY(:supplier_ids)
+            ORDER BY supplier_id, product_id
+        )
+        SELECT p.supplier_id, p.product_id, p.product_name, s.ds, s.y
+        FROM p LEFT JOIN sales_history s USING (product_id)
+        ORDER BY p.supplier_id, s.ds
+    """)
+    df = pd.read_sql(
+        forecast_query, engine,
+        params={'supplier_ids': [int(supplier_id) for supplier_id in supplier_ids]},
+        parse_dates=['ds'],
+    )
+    return {int(supplier_id): rows for supplier_id, rows in df.groupby('supplier_id', sort=False)}
+
+def _prepare_forecast(rows):
+    """
+    Turns one supplier's rows into (product_id, product_name, history), or the
+    final message string when there is nothing to forecast.
+    """
+    if rows is None:
         return ""
 
-    # For simplicity, we'll forecast the first product found for this supplier
-    product_id = df_products.iloc[0]['product_id']
-    product_name = df_products.iloc[0]['product_name']
-    
-    product_sales_history = df_sales[df_sales['product_id'] == product_id].copy()
+    product_id, product_name = rows.iloc[0][['product_id', 'product_name']]
+    # LEFT JOIN yields a single null row when the product has no sales yet
+    product_sales_history = rows[['ds', 'y']].dropna()
     if len(product_sales_history) < 10:
         return f"Insufficient sales history for {product_name}."
 
     print(f"   📦 Demand Agent: Forecasting demand for '{product_name}'...")
-    
-    # 3. Build and train the Prophet forecasting model
-    # Prophet is designed to be robust and works well with default settings
-    model = Prophet(weekly_seasonality=True, daily_seasonality=False)
-    model.fit(product_sales_history)
-    
-    # 4. Make a future prediction (4 weeks ahead)
-    future = model.make_future_dataframe(periods=4, freq='W')
-    forecast = model.predict(future)
-    
+    return product_id, product_name, product_sales_history
+
+def _fast_forecast(product_sales_history: pd.DataFrame):
+    """
+    Predicts weekly sales FORECAST_HORIZON_WEEKS ahead with a linear trend plus the
+    average 52-week seasonal offset, all in NumPy. Returns None when the history is
+    too short or too noisy for this to be reliable.
+    """
+    y = product_sales_history['y'].to_numpy(dtype=float)
+    if len(y) < FAST_FORECAST_MIN_ROWS or y.mean() <= 0:
+        return None
+
+    t = np.arange(len(y))
+    slope, intercept = np.polyfit(t, y, 1)
+    residuals = y - (slope * t + intercept)
+    if residuals.std() / y.mean() > FAST_FORECAST_MAX_NOISE:
+        return None
+
+    target = len(y) - 1 + FORECAST_HORIZON_WEEKS
+    # Same week in previous years
+    seasonal_offset = residuals[target - 52::-52].mean()
+    return int(slope * target + intercept + seasonal_offset)
+
+def _prophet_forecast(model: Prophet) -> int:
+    # Only the final horizon week is reported, so predict that single row instead of
+    # the whole history plus horizon. Dates match make_future_dataframe(freq='W').
+    last_ds = model.history_dates.max()
+    future_dates = pd.date_range(start=last_ds, periods=FORECAST_HORIZON_WEEKS + 1, freq='W')
+    future_dates = future_dates[future_dates > last_ds][:FORECAST_HORIZON_WEEKS]
+    forecast = model.predict(pd.DataFrame({'ds': future_dates[-1:]}))
+    return int(forecast['yhat'].iloc[-1])
+
+def _forecast_statement(predicted_sales: int, product_name: str, product_sales_history: pd.DataFrame) -> str:
     current_sales = product_sales_history['y'].iloc[-1]
-    predicted_sales = int(forecast['yhat'].iloc[-1])
     
     percentage_change = round(((predicted_sales - current_sales) / current_sales) * 100)
     
@@ -56,11 +174,64 @@ def get_demand_forecast(at_risk_supplier_id: int) -> str:
     
     forecast_statement = (
         f"DEMAND FORECAST for '{product_name}': Sales are projected to be ~{predicted_sales} units/week "
-        f"in 4 weeks, a {percentage_change}% {trend} from current levels."
+        f"in {FORECAST_HORIZON_WEEKS} weeks, a {percentage_change}% {trend} from current levels."
     )
     
     return forecast_statement
 
+def get_demand_forecast(at_risk_supplier_id: int) -> str:
+    """
+    Finds products linked to a supplier and forecasts future demand using Prophet.
+    """
+    return get_demand_forecasts([at_risk_supplier_id])[0]
+
+def get_demand_forecasts(supplier_ids: list) -> list:
+    """
+    Batch version of get_demand_forecast. All suppliers' data is loaded in one
+    query, and models that need (re)fitting are trained in parallel worker
+    processes, since Stan fitting is CPU-bound.
+    Results come back in the same order as supplier_ids.
+    """
+    try:
+        inputs = _load_forecast_inputs(supplier_ids)
+    except Exception as e:
+        return [f"Database error: {e}"] * len(supplier_ids)
+
+    prepared = [_prepare_forecast(inputs.get(int(supplier_id))) for supplier_id in supplier_ids]
+
+    fast_predictions = {}
+    to_fit = {}
+    for item in prepared:
+        if isinstance(item, str):
+            continue
+        product_id, _, product_sales_history = item
+        predicted_sales = _fast_forecast(product_sales_history)
+        if predicted_sales is not None:
+            fast_predictions[product_id] = predicted_sales
+        elif _get_cached_model(product_id, product_sales_history) is None:
+            to_fit[product_id] = product_sales_history
+
+    if len(to_fit) > 1:
+        try:
+            pool = _get_fit_pool()
+            for product_id, model_json in zip(to_fit, pool.map(_fit_model_json, to_fit.values())):
+                _store_model(product_id, to_fit[product_id], model_from_json(model_json))
+        except BrokenProcessPool as e:
+            # Models not stored yet are fitted in-process below
+            print(f"   [Warning] Forecast worker pool failed, fitting in-process. Error: {e}")
+            _reset_fit_pool()
+
+    forecasts = []
+    for item in prepared:
+        if isinstance(item, str):
+            forecasts.append(item)
+            continue
+        product_id, product_name, product_sales_history = item
+        predicted_sales = fast_predictions.get(product_id)
+        if predicted_sales is None:
+            predicted_sales = _prophet_forecast(_get_fitted_model(product_id, product_sales_history))
+        forecasts.append(_forecast_statement(predicted_sales, product_name, product_sales_history))
+    return forecasts
 
 if __name__ == "__main__":
     # We will test with a supplier ID that we know has historical sales data (e.g., 1005)
@@ -9,22 +9,37 @@ def get_logistics_info(at_risk_supplier_id: int) -> str:
     """
     Checks for active or delayed shipments from an at-risk supplier.
     """
+    return get_logistics_infos([at_risk_supplier_id])[0]
+
+def get_logistics_infos(supplier_ids: list) -> list:
+    """
+    Batch version of get_logistics_info: one query covers every supplier.
+    Results come back in the same order as supplier_ids.
+    """
     try:
         engine = get_db_engine()
-        query = text("SELECT * FROM shipments WHERE supplier_id = :supplier_id AND status != 'Delivered'")
-        active_shipments = pd.read_sql(query, engine, params={'supplier_id': at_risk_supplier_id})
+        query = text("SELECT * FROM shipments WHERE supplier_id = ANY(:supplier_ids) AND status != 'Delivered'")
+        active_shipments = pd.read_sql(
+            query, engine, params={'supplier_ids': [int(supplier_id) for supplier_id in supplier_ids]}
+        )
     except Exception as e:
-        return f"Database error: {e}"
+        return [f"Database error: {e}"] * len(supplier_ids)
+
+    # For simplicity, we'll just report on the first found shipment per supplier
+    first_shipments = active_shipments.drop_duplicates('supplier_id').set_index('supplier_id')
 
-    if not active_shipments.empty:
-        # For simplicity, we'll just report on the first found shipment
-        shipment = active_shipments.iloc[0]
+    logistics_alerts = []
+    for supplier_id in supplier_ids:
+        if supplier_id not in first_shipments.index:
+            logistics_alerts.append("") # Empty string if no active shipments
+            continue
+        shipment = first_shipments.loc[supplier_id]
         shipment_id = shipment['shipment_id']
         status = shipment['status']
         risk_level = shipment['route_risk_level']
         
         logistics_alert = f"LOGISTICS ALERT: Shipment '{shipment_id}' is currently '{status}' on a '{risk_level}' risk route."
-        print(f"   🚚 Logistics Agent: Found active shipment for supplier {at_risk_supplier_id}.")
-        return logistics_alert
+        print(f"   🚚 Logistics Agent: Found active shipment for supplier {supplier_id}.")
+        logistics_alerts.append(logistics_alert)
 
-    return "" # Return empty string if no active shipments
\ No newline at end of file
+    return logistics_alerts
@@ -1,6 +1,12 @@
 import os
+import re
 import json
+import hashlib
+import time
+import asyncio
+import threading
 import redis
+from functools import lru_cache
 from dotenv import load_dotenv
 from ibm_watson_machine_learning.foundation_models import Model
 from newsdataapi import NewsDataApiClient
@@ -13,7 +19,9 @@ NEWSDATA_API_KEY = os.getenv("NEWSDATA_API_KEY")
 REDIS_URL = os.getenv("REDIS_URL")
 
 try:
-    redis_client = redis.from_url(REDIS_URL)
+    # A blocking pool lets the concurrent agent threads share a bounded set of connections
+    redis_pool = redis.BlockingConnectionPool.from_url(REDIS_URL, max_connections=16, socket_keepalive=True)
+    redis_client = redis.Redis(connection_pool=redis_pool)
     print("✅ Successfully connected to Redis cache.")
 except Exception as e:
     print(f"⚠️ Could not connect to Redis. Caching will be disabled. Error: {e}")
@@ -27,13 +35,69 @@ parameters = {
     "repetition_penalty": 1,
 }
 
-def get_risk_summary(risk_topic: str, country_code: str, user_api_key:str, user_project_id:str) -> dict:
+# Upper bound on simultaneous watsonx.ai calls from one batch
+WATSONX_MAX_CONCURRENCY = 8
+# Upper bound on simultaneous Newsdata.io requests from one batch
+NEWS_MAX_CONCURRENCY = 8
+
+# Caps on the news text sent to the LLM, which bills per input token
+MAX_PROMPT_ARTICLES = 20
+MAX_PROMPT_CHARS = 6000
+
+# Extracts the content between the <response> tags of the model output
+RESPONSE_BLOCK_RE = re.compile(r"<response>(.*?)</response>", re.DOTALL)
+
+# Clients are built once and shared across suppliers and runs. The news client keeps
+# a requests session, so its HTTP connections are reused; the watsonx.ai model reuses
+# its IAM token (each generate_text call is still a separate request).
+@lru_cache(maxsize=1)
+def _get_news_client() -> NewsDataApiClient:
+    return NewsDataApiClient(apikey=NEWSDATA_API_KEY, session=True)
+
+@lru_cache(maxsize=16)
+def _get_watsonx_model(user_api_key: str, user_project_id: str) -> Model:
+    return Model(
+        model_id=model_id,
+        params=parameters,
+        credentials={"apikey": user_api_key, "url": "https://us-south.ml.cloud.ibm.com"},
+        project_id=user_project_id
+    )
+
+# In-process copy of recent summaries, checked before Redis. Consecutive scheduled
+# runs mostly repeat the same topic/country pairs, and this still works when Redis is down.
+LOCAL_CACHE_MAX_ENTRIES = 256
+LOCAL_CACHE_TTL_SECONDS = 600
+_local_cache = {}
+_local_cache_lock = threading.Lock()
+
+def _read_local_summary(cache_key: str):
+    with _local_cache_lock:
+        entry = _local_cache.get(cache_key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del _local_cache[cache_key]
+            return None
+        return entry[1]
+
+def _write_local_summary(cache_key: str, result_dict: dict) -> None:
+    with _local_cache_lock:
+        now = time.monotonic()
+        if cache_key not in _local_cache and len(_local_cache) >= LOCAL_CACHE_MAX_ENTRIES:
+            # Drop expired entries, then the oldest insertion if still full
+            for key in [key for key, (expires_at, _) in _local_cache.items() if expires_at <= now]:
+                del _local_cache[key]
+            if len(_local_cache) >= LOCAL_CACHE_MAX_ENTRIES:
+                del _local_cache[next(iter(_local_cache))]
+        _local_cache[cache_key] = (now + LOCAL_CACHE_TTL_SECONDS, result_dict)
+
+def _get_cache_key(risk_topic: str, country_code: str) -> str:
+    return f"news_risk:{risk_topic}:{country_code}"
+
+def _read_cached_summary(cache_key: str):
     """
-    Fetches news using Newsdata.io and returns an AI-generated summary.
+    Returns the cached summary for the key, or None on a miss or Redis failure.
     """
-    print(f"\n🌍 Global Risk Agent: Scanning Newsdata.io for '{risk_topic}' in '{country_code}'...")
-
-    cache_key = f"news_risk:{risk_topic}:{country_code}"
     if redis_client:
         try:
             cached_result_bytes = redis_client.get(cache_key)
@@ -45,11 +109,52 @@ def get_risk_summary(risk_topic: str, country_code: str, user_api_key:str, user_
             print(f"   [CACHE WARNING] Could not read from Redis. Bypassing cache. Error: {e}")
 
     print(f"   [CACHE MISS] No result found for key: {cache_key}. Fetching from APIs...")
+    return None
 
+def _write_cached_summary(cache_key: str, result_dict: dict, ttl: int = 3600) -> None:
+    if redis_client:
+        try:
+            # Cache the result for 1 hour (3600 seconds) by default
+            redis_client.set(cache_key, json.dumps(result_dict), ex=ttl)
+            print(f"   [CACHE SET] Saved result for key: {cache_key}")
+        except Exception as e:
+            print(f"   [CACHE WARNING] Could not write to Redis. Error: {e}")
+
+def _read_cached_summaries(cache_keys: list) -> dict:
+    """
+    Looks up several cache keys in one MGET round-trip. Only hits are returned.
+    """
+    cached_results = {}
+    if redis_client and cache_keys:
+        try:
+            for cache_key, cached_result_bytes in zip(cache_keys, redis_client.mget(cache_keys)):
+                if cached_result_bytes:
+                    print(f"   [CACHE HIT] Found result for key: {cache_key}")
+                    cached_results[cache_key] = json.loads(cached_result_bytes.decode('utf-8'))
+        except Exception as e:
+            print(f"   [CACHE WARNING] Could not read from Redis. Bypassing cache. Error: {e}")
+    return cached_results
 
+def _write_cached_summaries(results: dict) -> None:
+    """
+    Saves several results in one pipelined round-trip.
+    """
+    if redis_client and results:
+        try:
+            pipe = redis_client.pipeline()
+            for cache_key, result_dict in results.items():
+                pipe.set(cache_key, json.dumps(result_dict), ex=3600)
+            pipe.execute()
+            print(f"   [CACHE SET] Saved {len(results)} results.")
+        except Exception as e:
+            print(f"   [CACHE WARNING] Could not write to Redis. Error: {e}")
 
+def _fetch_news(risk_topic: str, country_code: str) -> dict:
+    """
+    Fetches the latest articles from Newsdata.io and joins them into one text block.
+    """
     try:
-        api = NewsDataApiClient(apikey=NEWSDATA_API_KEY)
+        api = _get_news_client()
         
         response = api.latest_api(q=risk_topic, country=country_code, language='en')
         
@@ -65,14 +170,29 @@ def get_risk_summary(risk_topic: str, country_code: str, user_api_key:str, user_
             return {"error": "No news found for the given criteria."}
 
 
-        articles_content = [f"{article['title']}. {article.get('description', '')}" for article in articles]
+        # Keep the prompt small: the newest articles carry the signal, the tail mostly repeats it
+        articles_content = []
+        total_chars = 0
+        for article in articles[:MAX_PROMPT_ARTICLES]:
+            description = article.get('description')
+            content = f"{article['title']}. {description}" if description else article['title']
+            if articles_content and total_chars + len(content) > MAX_PROMPT_CHARS:
+                break
+            articles_content.append(content)
+            total_chars += len(content)
         articles_text = " ".join(articles_content)
-        print(f"   Found {len(articles)} relevant articles.")
+        print(f"   Found {len(articles)} relevant articles, using {len(articles_content)}.")
 
     except Exception as e:
         print(f"   [DEBUG] An exception occurred while calling the API.")
         return {"error": f"An API exception occurred: {e}"}
 
+    return {"articles_text": articles_text}
+
+def _summarize_news(articles_text: str, user_api_key: str, user_project_id: str) -> dict:
+    """
+    Asks watsonx.ai for a structured summary of the articles.
+    """
     prompt = f"""
     Read the following news articles. 
     First, in a <think> block, reason about the content. Identify the main topic, potential risks, and key entities.
@@ -87,37 +207,16 @@ def get_risk_summary(risk_topic: str, country_code: str, user_api_key:str, user_
     """
 
     try:
-        model = Model(
-            model_id=model_id,
-            params=parameters,
-            credentials={"apikey": user_api_key, "url": "https://us-south.ml.cloud.ibm.com"},
-            project_id=user_project_id
-        )
+        model = _get_watsonx_model(user_api_key, user_project_id)
         generated_text = model.generate_text(prompt)
         print("   watsonx.ai generated a structured response.")
         
         try:
-            start_tag = "<response>"
-            end_tag = "</response>"
-            start_index = generated_text.find(start_tag)
-            end_index = generated_text.find(end_tag)
-            
-            if start_index != -1 and end_index != -1:
-                # Extract the content between the tags
-                response_content = generated_text[start_index + len(start_tag):end_index].strip()
+            match = RESPONSE_BLOCK_RE.search(generated_text)
+            if match:
                 # The content might be a JSON object directly or a code block containing JSON
-                json_string = response_content.strip('` \njson')
-                result_dict = json.loads(json_string)
-
-                if redis_client:
-                    try:
-                        # Cache the result for 1 hour (3600 seconds)
-                        redis_client.set(cache_key, json.dumps(result_dict), ex=3600)
-                        print(f"   [CACHE SET] Saved result for key: {cache_key}")
-                    except Exception as e:
-                        print(f"   [CACHE WARNING] Could not write to Redis. Error: {e}")
-
-                return result_dict
+                json_string = match.group(1).strip().strip('`').removeprefix('json').strip()
+                return json.loads(json_string)
             else:
                 return {"error": "AI did not return a valid <response> block."}
         except Exception as e:
@@ -128,6 +227,117 @@ def get_risk_summary(risk_topic: str, country_code: str, user_api_key:str, user_
              return {"error": "Watsonx.ai token quota has been reached."}
         return {"error": f"Error connecting to watsonx.ai: {e}"}
 
+def _get_llm_cache_key(articles_text: str) -> str:
+    # Same articles + same model settings -> same summary, whatever query found them
+    prompt_digest = hashlib.sha256(
+        (articles_text + model_id + json.dumps(parameters, sort_keys=True)).encode('utf-8')
+    ).hexdigest()
+    return f"llm:{model_id}:{prompt_digest}"
+
+def _get_news_summary(articles_text: str, user_api_key: str, user_project_id: str) -> dict:
+    """
+    Returns the watsonx.ai summary for the articles, reusing a cached one when
+    the exact same articles were summarized in the last 24 hours.
+    """
+    llm_cache_key = _get_llm_cache_key(articles_text)
+    cached_result = _read_cached_summary(llm_cache_key)
+    if cached_result is not None:
+        return cached_result
+
+    result_dict = _summarize_news(articles_text, user_api_key, user_project_id)
+    if "error" not in result_dict:
+        _write_cached_summary(llm_cache_key, result_dict, ttl=86400)
+    return result_dict
+
+def get_risk_summary(risk_topic: str, country_code: str, user_api_key:str, user_project_id:str) -> dict:
+    """
+    Fetches news using Newsdata.io and returns an AI-generated summary.
+    """
+    print(f"\n🌍 Global Risk Agent: Scanning Newsdata.io for '{risk_topic}' in '{country_code}'...")
+
+    cache_key = _get_cache_key(risk_topic, country_code)
+    cached_result = _read_local_summary(cache_key)
+    if cached_result is not None:
+        return cached_result
+    cached_result = _read_cached_summary(cache_key)
+    if cached_result is not None:
+        _write_local_summary(cache_key, cached_result)
+        return cached_result
+
+    news = _fetch_news(risk_topic, country_code)
+    if "error" in news:
+        return news
+
+    result_dict = _get_news_summary(news["articles_text"], user_api_key, user_project_id)
+    if "error" not in result_dict:
+        _write_local_summary(cache_key, result_dict)
+        _write_cached_summary(cache_key, result_dict)
+    return result_dict
+
+async def get_risk_summaries(queries: list, user_api_key: str, user_project_id: str) -> list:
+    """
+    Batch version of get_risk_summary for a list of (risk_topic, country_code) pairs.
+    Cache hits short-circuit; the remaining news fetches and summaries run concurrently.
+    Results come back in the same order as the queries.
+    """
+    unique_queries = list(dict.fromkeys(queries))
+    cache_keys = {query: _get_cache_key(*query) for query in unique_queries}
+    results = {}
+    for query in unique_queries:
+        cached_result = _read_local_summary(cache_keys[query])
+        if cached_result is not None:
+            results[query] = cached_result
+
+    # Suppliers often share a topic/country, so each distinct pair is looked up once
+    cached_results = await asyncio.to_thread(
+        _read_cached_summaries, [cache_keys[query] for query in unique_queries if query not in results]
+    )
+
+    pending = []
+    for query in unique_queries:
+        if query in results:
+            continue
+        if cache_keys[query] in cached_results:
+            results[query] = cached_results[cache_keys[query]]
+            _write_local_summary(cache_keys[query], results[query])
+        else:
+            print(f"\n🌍 Global Risk Agent: Scanning Newsdata.io for '{query[0]}' in '{query[1]}'...")
+            pending.append(query)
+
+    # The news client is blocking, so each fetch runs in a worker thread, bounded like the summaries
+    news_semaphore = asyncio.Semaphore(NEWS_MAX_CONCURRENCY)
+
+    async def fetch(risk_topic: str, country_code: str) -> dict:
+        async with news_semaphore:
+            return await asyncio.to_thread(_fetch_news, risk_topic, country_code)
+
+    news_results = await asyncio.gather(*(fetch(risk_topic, country_code) for risk_topic, country_code in pending))
+
+    # Summaries also run concurrently, bounded so watsonx.ai isn't flooded
+    watsonx_semaphore = asyncio.Semaphore(WATSONX_MAX_CONCURRENCY)
+
+    async def summarize(articles_text: str) -> dict:
+        async with watsonx_semaphore:
+            return await asyncio.to_thread(_get_news_summary, articles_text, user_api_key, user_project_id)
+
+    to_summarize = []
+    for query, news in zip(pending, news_results):
+        if "error" in news:
+            results[query] = news
+        else:
+            to_summarize.append((query, news["articles_text"]))
+    summaries = await asyncio.gather(*(summarize(articles_text) for _, articles_text in to_summarize))
+
+    new_results = {}
+    for (query, _), result_dict in zip(to_summarize, summaries):
+        if "error" not in result_dict:
+            new_results[cache_keys[query]] = result_dict
+            _write_local_summary(cache_keys[query], result_dict)
+        results[query] = result_dict
+    await asyncio.to_thread(_write_cached_summaries, new_results)
+
+    return [results[query] for query in queries]
+
 
 if __name__ == "__main__":
     print("--- RUNNING A DEFINITIVE TEST WITH NEWSDATA.IO ---")
@@ -14,17 +14,27 @@ def find_at_risk_suppliers() -> pd.DataFrame:
     
     try:
         engine = get_db_engine()
-        query = text("SELECT * FROM suppliers;")
-        df = pd.read_sql(query, engine)
+        # A supplier is at risk if its status is not 'OK' OR its risk score is too high.
+        # The database applies the filter so only at-risk rows, and only the
+        # columns the orchestrator reads, are transferred.
+        query = text("""
+            SELECT supplier_id, supplier_name, country, production_status, risk_score
+            FROM suppliers
+            WHERE production_status IS DISTINCT FROM 'OK' OR risk_score >= :threshold;
+        """)
+        at_risk_suppliers = pd.read_sql(query, engine, params={'threshold': RISK_THRESHOLD})
+        # Status and country take few distinct values, so categoricals compare on integer codes
+        at_risk_suppliers = at_risk_suppliers.astype({
+            'production_status': 'category',
+            'country': 'category',
+        })
+        # A NULL status would otherwise show up as "nan" in the alert text
+        at_risk_suppliers['production_status'] = (
+            at_risk_suppliers['production_status'].cat.add_categories('UNKNOWN').fillna('UNKNOWN')
+        )
     except Exception as e:
         print(f"Error reading from database: {e}")
         return pd.DataFrame()
-
-    # 2. Define risk criteria
-    # A supplier is at risk if its status is not 'OK' OR its risk score is too high.
-    at_risk_criteria = (df['production_status'] != 'OK') | (df['risk_score'] >= RISK_THRESHOLD)
-    
-    at_risk_suppliers = df[at_risk_criteria]
     
     if not at_risk_suppliers.empty:
         print(f"   Found {len(at_risk_suppliers)} suppliers matching risk criteria.")
@@ -1,23 +1,81 @@
 import re
+import asyncio
+import numpy as np
 import pycountry
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from functools import lru_cache, partial
 
 # Import the functions from our agent files
 from .agents.supplier_agent import find_at_risk_suppliers
-from .agents.risk_agent import get_risk_summary
-from .agents.demand_agent import get_demand_forecast
-from .agents.logistics_agent import get_logistics_info
+from .agents.risk_agent import get_risk_summaries
+from .agents.demand_agent import get_demand_forecasts
+from .agents.logistics_agent import get_logistics_infos
 
+# First number in a demand forecast message
+_DIGIT_RE = re.compile(r'(\d+)')
+
+# Most the agents can add to the internal risk score: news category + demand spike + delayed shipment
+MAX_SCORE_ADJUSTMENT = 5 + 5 + 3
+
+# Used instead of a news check for suppliers that stay LOW whatever the news says
+SKIPPED_RISK_SUMMARY = {
+    "risk_category": "Not Assessed",
+    "summary": "News check skipped: the internal risk score is too low for the news to raise the priority.",
+    "key_entities": [],
+}
+
+NO_ALERTS_MESSAGE = "✅ Analysis Complete: No high-risk suppliers found."
+
+@dataclass
+class Alert:
+    """
+    One generated supplier alert. `text` is the formatted message shown to users.
+    """
+    priority: str
+    supplier_id: int
+    supplier_name: str
+    text: str
+    ts: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+# News risk categories that add the most to a supplier's score
+HIGH_IMPACT_CATEGORIES = ['Logistics', 'Natural Disaster', 'Geopolitical']
+
+PRIORITY_COLORS = {
+    "CRITICAL": "🔴",
+    "HIGH": "🟠",
+    "MEDIUM": "🟡",
+    "LOW": "🟢",
+}
+
+def _build_country_codes() -> dict:
+    """
+    Maps lower-cased country names (plus official and common names) to alpha_2 codes.
+    """
+    country_codes = {}
+    for country in pycountry.countries:
+        for attr in ('name', 'official_name', 'common_name'):
+            name = getattr(country, attr, None)
+            if name:
+                country_codes.setdefault(name.lower(), country.alpha_2.lower())
+    return country_codes
+
+_COUNTRY_CODES = _build_country_codes()
+
+@lru_cache(maxsize=512) # Suppliers share countries, and fuzzy search is slow
 def get_country_code(country_name: str) -> str:
     """
     Converts a country name to its 2-letter alpha_2 code using pycountry.
     Includes fuzzy searching for common mismatches.
+    Results are memoized, so the fallback warning is printed once per name.
     """
     try:
-        # First, try a direct lookup
-        country = pycountry.countries.get(name=country_name)
-        if country:
-            return country.alpha_2.lower()
-        
+        # First, try a direct lookup in the precomputed table
+        code = _COUNTRY_CODES.get(country_name.lower())
+        if code:
+            return code
+
         # If direct lookup fails, try a fuzzy search
         country = pycountry.countries.search_fuzzy(country_name)
         if country:
@@ -30,124 +88,129 @@ def get_country_code(country_name: str) -> str:
     print(f"   [Warning] Could not find country code for '{country_name}'. Defaulting to 'us'.")
     return "us"
 
-def run_supply_chain_analysis(user_api_key: str, user_project_id: str):
+# Dedicated, bounded pool for the blocking supplier, demand and logistics calls. The
+# agents release the GIL while waiting on the DB, so threads overlap that latency.
+# The risk agent bounds its own per-query news and watsonx.ai fan-out.
+AGENT_MAX_WORKERS = 8
+_agent_executor = ThreadPoolExecutor(max_workers=AGENT_MAX_WORKERS, thread_name_prefix="agent")
+
+async def _run_blocking(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_agent_executor, partial(func, *args))
+
+async def run_supply_chain_analysis(user_api_key: str, user_project_id: str):
     """
-    The main orchestrator logic. Returns a list of alert strings.
+    The main orchestrator logic. Returns a list of Alert records (empty when
+    no supplier is at risk).
+    The risk, demand and logistics agents run concurrently for all suppliers.
     """
     print("📈 Master Orchestrator: Starting supply chain analysis...")
-    alerts = [] # Create a list to hold our alert strings
+    alerts = [] # Create a list to hold our alerts
 
     # 1. Get the list of at-risk suppliers
-    at_risk_suppliers = find_at_risk_suppliers()
+    at_risk_suppliers = await _run_blocking(find_at_risk_suppliers)
     
     if at_risk_suppliers.empty:
-        message = "✅ Analysis Complete: No high-risk suppliers found."
-        print(message)
-        return [{"message": message}]
-
-    # 2. For each at-risk supplier, get a risk summary
-    for index, supplier in at_risk_suppliers.iterrows():
-        supplier_id = supplier['supplier_id']
-        supplier_name = supplier['supplier_name']
-        country = supplier['country']
-        status = supplier['production_status']
-        final_score = supplier['risk_score']
-        # Convert country name to 2-letter code for the API
-        country_code = get_country_code(country)
-
-        # 3. Get the demand impact
-        demand_forecast_info = get_demand_forecast(supplier_id)
-
-        # 4. Get the logistics information
-        logistics_alert_info = get_logistics_info(supplier_id)
-
-        # 5. Get the risk summary
-        if status == 'DELAYED':
+        print(NO_ALERTS_MESSAGE)
+        return []
+
+    # 2. Build one news query per supplier, except those certain to stay LOW.
+    # CRITICAL suppliers are still checked: their alerts need the category and summary.
+    certain_low = at_risk_suppliers['risk_score'] + MAX_SCORE_ADJUSTMENT <= 5
+    risk_queries = []
+    for supplier in at_risk_suppliers[~certain_low].itertuples(index=False):
+        if supplier.production_status == 'DELAYED':
             topic = "shipping delay OR port congestion"
         else:
             topic = "supply chain disruption OR factory shutdown"
-        # Call the Global Risk Agent
-        risk_summary_data = get_risk_summary(topic, country_code, user_api_key, user_project_id)
-        # Analyze demand forecast
-
-
-        priority_level = "🟢 LOW"
-        if "error" in risk_summary_data:
-            news_summary_text = risk_summary_data["error"]
-            risk_category = "Error"
-            key_entities = []
-        else:
-            # Analyze risk category from news
-            risk_category = risk_summary_data.get("risk_category", "Other")
-            if risk_category in ['Logistics', 'Natural Disaster', 'Geopolitical']:
-                final_score += 5 # High impact categories
-            elif risk_category == 'Financial':
-                final_score += 2 # Medium impact
-
-            news_summary_text = risk_summary_data.get('summary', 'N/A')
-            key_entities = risk_summary_data.get('key_entities', [])
-
-
-
-
-        if demand_forecast_info and "increase" in demand_forecast_info:
-            # Find numbers in the forecast string
-            numbers = re.findall(r'\d+', demand_forecast_info)
-            if numbers:
-                percent_increase = int(numbers[0])
-                if percent_increase > 25:
-                    final_score += 5 # Major demand spike
-                elif percent_increase > 10:
-                    final_score += 2 # Moderate demand spike
-
-
-        # Analyze logistics status
-        if logistics_alert_info and "Delayed" in logistics_alert_info:
-            final_score += 3 # Active shipment is delayed
-
-        # Determine final priority level based on score
-        if final_score > 15:
-            priority_level = "CRITICAL"
-        elif final_score > 10:
-            priority_level = "HIGH"
-        elif final_score > 5:
-            priority_level = "MEDIUM"
-        else:
-            priority_level = "LOW"
-
-        priority_color={
-            "CRITICAL":"🔴",
-            "HIGH":"🟠",
-            "MEDIUM":"🟡",
-            "LOW":"🟢"
-        }
-        # --- REASONING ENGINE END ---
-
-        # --- 3. BUILD THE FINAL ALERT ---
-        alert_string = f"{priority_color[priority_level]} {priority_level} ALERT FOR: {supplier_name.upper()}\n"
-        alert_string += f"   - Supplier Status: {status} (Internal Risk Score: {supplier['risk_score']})\n"
+        # Convert country name to 2-letter code for the API
+        risk_queries.append((topic, get_country_code(supplier.country)))
+    supplier_ids = at_risk_suppliers['supplier_id'].tolist()
+
+    # 3. Call the Global Risk, Demand and Logistics agents concurrently.
+    # Demand and logistics each cover all suppliers in a single query.
+    assessed_summaries, demand_forecasts, logistics_infos = await asyncio.gather(
+        get_risk_summaries(risk_queries, user_api_key, user_project_id),
+        # Forecast models are fitted in parallel processes inside the demand agent
+        _run_blocking(get_demand_forecasts, supplier_ids),
+        _run_blocking(get_logistics_infos, supplier_ids),
+    )
+
+    assessed_summaries = iter(assessed_summaries)
+    risk_summaries = [SKIPPED_RISK_SUMMARY if skipped else next(assessed_summaries) for skipped in certain_low]
+
+    # 4. Line the agent results up with their suppliers
+    analysis = at_risk_suppliers.assign(
+        demand_forecast=demand_forecasts,
+        logistics_info=logistics_infos,
+        risk_category=["Error" if "error" in r else r.get("risk_category", "Other") for r in risk_summaries],
+        news_summary=[r["error"] if "error" in r else r.get('summary', 'N/A') for r in risk_summaries],
+        key_entities=[[] if "error" in r else r.get('key_entities', []) for r in risk_summaries],
+    )
+
+    # --- REASONING ENGINE: score every supplier at once ---
+    # Analyze risk category from news
+    category_points = np.select(
+        [analysis['risk_category'].isin(HIGH_IMPACT_CATEGORIES), analysis['risk_category'].eq('Financial')],
+        [5, 2], # High / medium impact
+        default=0,
+    )
+    # Analyze demand forecast: the first number in an "increase" forecast
+    is_increase = analysis['demand_forecast'].str.contains('increase', regex=False)
+    percent_increase = (
+        analysis['demand_forecast'].str.extract(_DIGIT_RE, expand=False)
+        .astype(float).where(is_increase).fillna(0)
+    )
+    demand_points = np.select(
+        [percent_increase > 25, percent_increase > 10],
+        [5, 2], # Major / moderate demand spike
+        default=0,
+    )
+    # Analyze logistics status: an active shipment is delayed
+    logistics_points = np.where(analysis['logistics_info'].str.contains('Delayed', regex=False), 3, 0)
+
+    final_scores = analysis['risk_score'] + category_points + demand_points + logistics_points
+    # Determine final priority level based on score
+    priority_levels = np.select(
+        [final_scores > 15, final_scores > 10, final_scores > 5],
+        ["CRITICAL", "HIGH", "MEDIUM"],
+        default="LOW",
+    )
+    # --- REASONING ENGINE END ---
+
+    for supplier, priority_level in zip(analysis.itertuples(index=False), priority_levels):
+        supplier_name = supplier.supplier_name
+        demand_forecast_info = supplier.demand_forecast
+        logistics_alert_info = supplier.logistics_info
+
+        # --- 5. BUILD THE FINAL ALERT ---
+        alert_lines = [
+            f"{PRIORITY_COLORS[priority_level]} {priority_level} ALERT FOR: {supplier_name.upper()}",
+            f"   - Supplier Status: {supplier.production_status} (Internal Risk Score: {supplier.risk_score})",
+        ]
         if demand_forecast_info:
-            alert_string += f"   - {demand_forecast_info}\n"
+            alert_lines.append(f"   - {demand_forecast_info}")
         if logistics_alert_info:
-            alert_string += f"   - {logistics_alert_info}\n"
-        alert_string += f"   - External Risk Category: {risk_category}\n"
-        alert_string += f"   - Key Entities: {', '.join(key_entities)}\n"
-        alert_string += f"   - News Summary: {news_summary_text}\n"
+            alert_lines.append(f"   - {logistics_alert_info}")
+        alert_lines += [
+            f"   - External Risk Category: {supplier.risk_category}",
+            f"   - Key Entities: {', '.join(supplier.key_entities)}",
+            f"   - News Summary: {supplier.news_summary}",
+        ]
+        alert_string = "\n".join(alert_lines) + "\n"
         
-        alerts.append({
-            "priority": priority_level,
-            "supplier_id": int(supplier_id),
-            "supplier_name": supplier_name,
-            "message": alert_string
-        })
+        alerts.append(Alert(
+            priority=str(priority_level),
+            supplier_id=int(supplier.supplier_id),
+            supplier_name=supplier_name,
+            text=alert_string,
+        ))
         print(f"Generated '{priority_level}' alert for {supplier_name}")
 
     if not alerts:
-        message = "✅ Analysis Complete: No high-risk suppliers found."
-        print(message)
-        return [{"message": message}]
+        print(NO_ALERTS_MESSAGE)
         
     return alerts
 
 if __name__ == "__main__":
-    run_supply_chain_analysis()
\ No newline at end of file
+    asyncio.run(run_supply_chain_analysis())
\ No newline at end of file
@@ -2,36 +2,53 @@
 
 from dotenv import load_dotenv
 import os
+import asyncio
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, HTTPException
 from sqlalchemy import text
-from datetime import datetime, timezone
 
-from .main_orchestrator import run_supply_chain_analysis
-from .utils.db import get_db_engine
+from .main_orchestrator import run_supply_chain_analysis, NO_ALERTS_MESSAGE
+from .utils.db import get_db_engine, ensure_schema, refresh_latest_alerts
 
 load_dotenv()
 
 WATSONX_API_KEY = os.getenv("WATSONX_API_KEY")
 WATSONX_PROJECT_ID = os.getenv("WATSONX_PROJECT_ID")
 
+def create_schema():
+    try:
+        ensure_schema()
+    except Exception as e:
+        print(f"⚠️ Could not create database indexes/views. Error: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Building the indexes can take a while on a large sales_history, so it runs in
+    # the background and the API starts serving right away
+    schema_task = asyncio.create_task(asyncio.to_thread(create_schema))
+    yield
+    if not schema_task.done():
+        # An interrupted concurrent build leaves an INVALID index; ensure_schema rebuilds it next startup
+        print("⚠️ Schema setup was still running at shutdown; unfinished indexes are rebuilt on the next start.")
+
 # Create a FastAPI application instance
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 @app.get("/")
 def read_root():
     return {"message": "Supply Chain Resilience System API is running."}
 
 @app.get("/run_analysis")
-def run_analysis_endpoint(api_key: str, project_id: str):
+async def run_analysis_endpoint(api_key: str, project_id: str):
     """
     This endpoint triggers the analysis using the provided credentials.
     """
     if not api_key or not project_id:
         raise HTTPException(status_code=400, detail="API key and Project ID are required.")
     
-    alerts = run_supply_chain_analysis(user_api_key=api_key, user_project_id=project_id)
-    result = [alert['message'] for alert in alerts]
+    alerts = await run_supply_chain_analysis(user_api_key=api_key, user_project_id=project_id)
+    result = [alert.text for alert in alerts] or [NO_ALERTS_MESSAGE]
     return {"alerts": result}
 
 @app.get("/run_scheduled_analysis")
@@ -41,37 +58,45 @@ def run_scheduled_analysis():
     """
     print("--- Starting Scheduled Analysis ---")
     
-    alerts = run_supply_chain_analysis(WATSONX_API_KEY, WATSONX_PROJECT_ID)
+    # This endpoint stays sync (it runs in FastAPI's threadpool), so it drives its own event loop
+    alerts = asyncio.run(run_supply_chain_analysis(WATSONX_API_KEY, WATSONX_PROJECT_ID))
     
-    if not alerts or "No high-risk suppliers found" in alerts[0]['message']:
+    if not alerts:
         print("No new alerts to save.")
         print("--- Scheduled Analysis Complete ---")
         return
 
-    # 2. Connect to the database
+    # 2. Prepare the rows before touching the database, so the transaction only covers the insert
+    stmt = text("""
+        INSERT INTO alerts (timestamp, supplier_id, priority, alert_text)
+        VALUES (:ts, :id, :prio, :text)
+    """)
+    rows = [
+        {
+            "ts": alert.ts,
+            "id": alert.supplier_id,
+            "prio": alert.priority,
+            "text": alert.text
+        }
+        for alert in alerts
+    ]
+
+    # 3. Insert all new alerts into the 'alerts' table in one executemany call
     try:
         engine = get_db_engine()
-        with engine.connect() as connection:
-            with connection.begin():
-                print(f"Saving {len(alerts)} new alerts to the database...")
-                # 3. Insert each new alert into the 'alerts' table
-                for alert in alerts:
-                    supplier_id = alert['supplier_id']
-                    priority = alert['priority']
-                    alert_text = alert['message']
-                    stmt = text("""
-                        INSERT INTO alerts (timestamp, supplier_id, priority, alert_text)
-                        VALUES (:ts, :id, :prio, :text)
-                    """)
-                    connection.execute(stmt, {
-                        "ts": datetime.now(timezone.utc),
-                        "id": supplier_id,
-                        "prio": priority,
-                        "text": alert_text
-                    })
-                print("All alerts saved successfully.")
+        print(f"Saving {len(alerts)} new alerts to the database...")
+        with engine.begin() as connection:
+            connection.execute(stmt, rows)
+        print("All alerts saved successfully.")
 
     except Exception as e:
         print(f"An error occurred while saving alerts to the database: {e}")
+
+    # Publish the new alerts to the dashboard's precomputed view
+    try:
+        refresh_latest_alerts()
+        print("Latest alerts view refreshed.")
+    except Exception as e:
+        print(f"An error occurred while refreshing the latest alerts view: {e}")
         
     print("--- Scheduled Analysis Complete ---")
@@ -1,18 +1,84 @@
 # server/utils/db.py
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from dotenv import load_dotenv
 
 load_dotenv()
 
+__all__ = ["engine", "get_db_engine", "ensure_schema", "refresh_latest_alerts"]
+
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL not found in environment variables.")
 
-engine = create_engine(DATABASE_URL)
+# Sized for the FastAPI worker threads plus the orchestrator's agent fan-out
+engine = create_engine(
+    DATABASE_URL,
+    pool_size=20,
+    max_overflow=40,
+    pool_timeout=30,
+    pool_recycle=1800,
+    pool_pre_ping=True,
+    pool_use_lifo=True,
+)
+
+# Indexes and views backing the hot queries. Each statement is idempotent.
+# The dashboard reads mv_latest_alerts, so it is created first; the slower
+# concurrent index builds on the large tables come last.
+SCHEMA_STATEMENTS = [
+    # Latest alerts joined with supplier details, precomputed for the dashboard
+    """
+    CREATE MATERIALIZED VIEW IF NOT EXISTS mv_latest_alerts AS
+    SELECT a.*, s.latitude, s.longitude, s.risk_score, s.supplier_name
+    FROM alerts a
+    JOIN suppliers s USING (supplier_id)
+    ORDER BY a.timestamp DESC
+    LIMIT 100
+    """,
+    # A unique index is required for REFRESH ... CONCURRENTLY
+    "CREATE UNIQUE INDEX IF NOT EXISTS mv_latest_alerts_id_idx ON mv_latest_alerts (id)",
+    "CREATE INDEX IF NOT EXISTS mv_latest_alerts_ts_idx ON mv_latest_alerts (timestamp DESC)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS sales_history_pid_ds_idx ON sales_history (product_id, ds)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS suppliers_status_risk_idx ON suppliers (production_status, risk_score)",
+]
+
+# Indexes built CONCURRENTLY above. An interrupted build leaves the index INVALID,
+# and IF NOT EXISTS would then skip it forever, so invalid ones are dropped and rebuilt.
+CONCURRENT_INDEXES = ["sales_history_pid_ds_idx", "suppliers_status_risk_idx"]
 
 def get_db_engine():
     """
     Returns the shared SQLAlchemy engine instance.
     """
-    return engine
\ No newline at end of file
+    return engine
+
+def ensure_schema():
+    """
+    Creates any missing indexes and views from SCHEMA_STATEMENTS. This is a one-time
+    migration; once everything exists, each statement is a no-op.
+    CREATE INDEX CONCURRENTLY can't run inside a transaction, so this uses an autocommit connection.
+    The first run blocks until the indexes are built, so callers shouldn't wait on it.
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        invalid_indexes = connection.execute(text("""
+            SELECT c.relname
+            FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE NOT i.indisvalid AND c.relname = ANY(:names)
+        """), {"names": CONCURRENT_INDEXES}).scalars().all()
+        for index_name in invalid_indexes:
+            print(f"⚠️ Rebuilding invalid index {index_name}")
+            connection.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{index_name}"'))
+
+        for statement in SCHEMA_STATEMENTS:
+            try:
+                connection.execute(text(statement))
+            except Exception as e:
+                # Keep going so one failing statement doesn't block the rest
+                print(f"⚠️ Schema statement failed: {e}")
+
+def refresh_latest_alerts():
+    """
+    Refreshes mv_latest_alerts without blocking dashboard reads.
+    """
+    with engine.begin() as connection:
+        connection.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_latest_alerts"))